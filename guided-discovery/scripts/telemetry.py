@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Measured duration telemetry for prompts and chains.
+
+Every prompt execution is appended to telemetry/executions.jsonl as compact
+start/end events (timestamps, output bytes, token count, outcome). Historical
+runs are backfilled by streaming through the interaction logs, outputs/*.md
+and the chain history in contexts/active/. Chain metadata can then be
+regenerated from measured p50/p95 durations instead of hand-written guesses.
+
+Usage:
+    python3 telemetry.py start --task 20250727-154946 --chain tech_analysis --prompt tech_stack_identifier
+    python3 telemetry.py end --task 20250727-154946 --prompt tech_stack_identifier --output outputs/x.md
+    python3 telemetry.py backfill
+    python3 telemetry.py stats
+    python3 telemetry.py metadata [--dry-run] [--min-samples 5]
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STORE_PATH = os.path.join(BASE_DIR, 'telemetry', 'executions.jsonl')
+CHAINS_DIR = os.path.join(BASE_DIR, 'chains')
+CONTEXTS_DIR = os.path.join(BASE_DIR, 'contexts', 'active')
+OUTPUTS_DIR = os.path.join(BASE_DIR, 'outputs')
+LOG_FILES = [
+    os.path.join(BASE_DIR, 'discovery_interaction_log.txt'),
+    os.path.join(BASE_DIR, 'discovery_interaction_complete.txt'),
+]
+
+# Rough token estimate when the caller doesn't know the real count
+BYTES_PER_TOKEN = 4
+
+# Completed runs needed before a measured duration replaces the estimate
+MIN_SAMPLES = 5
+
+TASK_ID_RE = re.compile(r'(\d{8}-\d{6})')
+CHAIN_CMD_RE = re.compile(r'^USER: /chain\s+(--prompts\s+\S+|\S+)')
+EXECUTING_RE = re.compile(r'^\*\*Executing\*\*: ([A-Za-z0-9_]+) \((\d+)/(\d+)')
+OUTPUT_NAME_RE = re.compile(r'^(.+)_(\d{8}-\d{6})\.md$')
+DURATION_LINE_RE = re.compile(r'^([ \t]*)(average_duration|duration_p50|duration_p95|duration_samples):.*\n?', re.MULTILINE)
+METADATA_RE = re.compile(r'^metadata:\n', re.MULTILINE)
+
+
+def now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_time(value):
+    """Parse context timestamps, which are inconsistently suffixed with Z"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', ''))
+    except ValueError:
+        return None
+
+
+def estimate_tokens(size):
+    return int(math.ceil(size / BYTES_PER_TOKEN)) if size else 0
+
+
+def append(records, store=STORE_PATH):
+    os.makedirs(os.path.dirname(store), exist_ok=True)
+    with open(store, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def read_events(store=STORE_PATH):
+    """Stream raw events from the store"""
+    if not os.path.exists(store):
+        return
+    with open(store, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def executions(store=STORE_PATH):
+    """Pair start/end events into executions
+
+    Backfilled runs are keyed by their source, and a later record for the same
+    source (e.g. a chain that has since completed) replaces the earlier one.
+    """
+    open_runs = {}
+    backfilled = {}
+    for event in read_events(store):
+        ev = event.get('ev')
+        if ev == 'run':
+            if event.get('src'):
+                backfilled.pop(event['src'], None)
+                backfilled[event['src']] = event
+            else:
+                yield event
+        elif ev == 'start':
+            open_runs[(event.get('task'), event.get('name'))] = event
+        elif ev == 'end':
+            start = open_runs.pop((event.get('task'), event.get('name')), None)
+            if start is None:
+                continue
+            run = dict(start, **event)
+            run['ev'] = 'run'
+            run['t0'] = start['t0']
+            t0, t1 = parse_time(run['t0']), parse_time(run.get('t1'))
+            run['dur'] = (t1 - t0).total_seconds() if t0 and t1 else None
+            yield run
+
+    yield from backfilled.values()
+
+
+def record_key(record):
+    return (record.get('src'), record.get('t1'), record.get('outcome'))
+
+
+def known_records(store=STORE_PATH):
+    return {record_key(event) for event in read_events(store) if event.get('src')}
+
+
+# ---------------------------------------------------------------------------
+# Live recording
+# ---------------------------------------------------------------------------
+
+def record_start(task, name, chain=None, kind='prompt', store=STORE_PATH):
+    event = {'ev': 'start', 'kind': kind, 'name': name, 'chain': chain, 'task': task, 't0': now()}
+    append([event], store)
+    return event
+
+
+def record_end(task, name, outcome='completed', output=None, tokens=None, store=STORE_PATH):
+    size = os.path.getsize(output) if output and os.path.exists(output) else 0
+    event = {
+        'ev': 'end',
+        'name': name,
+        'task': task,
+        't1': now(),
+        'bytes': size,
+        'tokens': tokens if tokens is not None else estimate_tokens(size),
+        'outcome': outcome,
+    }
+    append([event], store)
+    return event
+
+
+# ---------------------------------------------------------------------------
+# Backfill
+# ---------------------------------------------------------------------------
+
+def run_record(kind, name, task, src, chain=None, t0=None, t1=None, size=0, outcome='completed'):
+    start, end = parse_time(t0), parse_time(t1)
+    return {
+        'ev': 'run',
+        'kind': kind,
+        'name': name,
+        'chain': chain,
+        'task': task,
+        't0': t0,
+        't1': t1,
+        'dur': (end - start).total_seconds() if start and end else None,
+        'bytes': size,
+        'tokens': estimate_tokens(size),
+        'outcome': outcome,
+        'src': src,
+    }
+
+
+def backfill_contexts(contexts_dir=CONTEXTS_DIR):
+    """Chain and prompt timings recorded in context chain_history/chain_progress"""
+    for path in sorted(glob.glob(os.path.join(contexts_dir, '*.json'))):
+        rel = os.path.relpath(path, BASE_DIR)
+        match = TASK_ID_RE.search(os.path.basename(path))
+        task = match.group(1) if match else None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                context = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+
+        seen = set()
+        for entry in context.get('chain_history') or []:
+            if not isinstance(entry, dict) or not entry.get('started_at'):
+                continue
+            kind = 'chain' if entry.get('chain') else 'prompt'
+            name = entry.get('chain') or entry.get('prompt')
+            seen.add(name)
+            yield run_record(kind, name, task, f"{rel}#chain_history.{name}@{entry['started_at']}",
+                             chain=entry.get('chain'),
+                             t0=entry.get('started_at'),
+                             t1=entry.get('completed_at'),
+                             outcome=entry.get('outcome') or ('completed' if entry.get('completed_at') else 'incomplete'))
+
+        for name, progress in (context.get('chain_progress') or {}).items():
+            if name in seen or not isinstance(progress, dict) or not progress.get('started_at'):
+                continue
+            yield run_record('chain', name, task, f"{rel}#chain_progress.{name}",
+                             chain=name,
+                             t0=progress.get('started_at'),
+                             t1=progress.get('completed_at'),
+                             outcome='completed' if progress.get('completed_at') else 'incomplete')
+
+
+def backfill_log(path):
+    """Stream an interaction log and yield one record per executed prompt
+
+    The logs carry no timestamps, so these records contribute volume and
+    outcome but not duration.
+    """
+    rel = os.path.relpath(path, BASE_DIR)
+    chain = task = None
+    current = None
+
+    def close(outcome):
+        record = run_record('prompt', current['name'], task, f"{rel}:{current['line']}",
+                            chain=chain, size=current['bytes'], outcome=outcome)
+        record['step'] = current['step']
+        return record
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            if line.startswith('USER:'):
+                if current:
+                    yield close('interrupted')
+                    current = None
+                match = CHAIN_CMD_RE.match(line)
+                if match:
+                    chain = 'custom' if match.group(1).startswith('--prompts') else match.group(1)
+                    found = TASK_ID_RE.search(line)
+                    task = found.group(1) if found else task
+                continue
+
+            match = EXECUTING_RE.match(line)
+            if match:
+                if current:
+                    yield close('completed')
+                current = {'name': match.group(1), 'step': int(match.group(2)), 'line': lineno, 'bytes': 0}
+                continue
+
+            if current is None:
+                continue
+            if line.strip() == '---':
+                yield close('completed')
+                current = None
+            else:
+                current['bytes'] += len(line.encode('utf-8'))
+
+    if current:
+        # The log simply ends here, which says nothing about the prompt
+        yield close('unknown')
+
+
+def backfill_outputs(records, outputs_dir=OUTPUTS_DIR):
+    """Attach saved output sizes to matching runs, or add them as runs"""
+    for path in sorted(glob.glob(os.path.join(outputs_dir, '*.md'))):
+        match = OUTPUT_NAME_RE.match(os.path.basename(path))
+        if not match:
+            continue
+        name, task = match.groups()
+        size = os.path.getsize(path)
+        for record in records:
+            if record['name'] == name and record['task'] == task and record['kind'] == 'prompt':
+                record['out_bytes'] = size
+                break
+        else:
+            records.append(run_record('prompt', name, task, os.path.relpath(path, BASE_DIR), size=size))
+
+
+def backfill(store=STORE_PATH, log_files=LOG_FILES):
+    """Append historical runs not already in the store; returns the new records"""
+    records = list(backfill_contexts())
+
+    # The complete log repeats the short one; keep one record per run,
+    # preferring a definite outcome over one where the log was cut off
+    runs = {}
+    for path in log_files:
+        if not os.path.exists(path):
+            continue
+        for record in backfill_log(path):
+            key = (record['task'], record['chain'], record['name'], record['step'])
+            current = runs.get(key)
+            if current is None or (current['outcome'] == 'unknown' and record['outcome'] != 'unknown'):
+                runs[key] = record
+    records.extend(runs.values())
+
+    backfill_outputs(records)
+
+    # A source seen before is appended again only if it has changed since,
+    # e.g. an incomplete chain that now has a completed_at
+    existing = known_records(store)
+    new = [r for r in records if record_key(r) not in existing]
+    append(new, store)
+    return new
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(store=STORE_PATH):
+    """Aggregate executions into per-(kind, name) duration and volume stats"""
+    groups = {}
+    for run in executions(store):
+        key = (run.get('kind') or 'prompt', run['name'])
+        group = groups.setdefault(key, {'runs': 0, 'durations': [], 'bytes': [], 'outcomes': {}})
+        group['runs'] += 1
+        if run.get('dur') is not None and run.get('outcome') == 'completed':
+            group['durations'].append(run['dur'])
+        if run.get('bytes'):
+            group['bytes'].append(run['bytes'])
+        outcome = run.get('outcome') or 'unknown'
+        group['outcomes'][outcome] = group['outcomes'].get(outcome, 0) + 1
+
+    stats = {}
+    for key, group in groups.items():
+        stats[key] = {
+            'runs': group['runs'],
+            'samples': len(group['durations']),
+            'p50': percentile(group['durations'], 50),
+            'p95': percentile(group['durations'], 95),
+            'bytes_p50': percentile(group['bytes'], 50),
+            'bytes_p95': percentile(group['bytes'], 95),
+            'outcomes': group['outcomes'],
+        }
+    return stats
+
+
+def format_minutes(seconds):
+    return f"{max(1, int(round(seconds / 60.0)))} minutes"
+
+
+def print_stats(stats):
+    # Slowest first so the prompts worth optimizing are at the top
+    rows = sorted(stats.items(), key=lambda item: -(item[1]['p95'] or 0))
+    print(f"{'kind':<7} {'name':<40} {'runs':>4} {'n':>3} {'p50':>8} {'p95':>8} {'bytes p95':>10}")
+    for (kind, name), s in rows:
+        p50 = f"{s['p50'] / 60:.1f}m" if s['p50'] is not None else '-'
+        p95 = f"{s['p95'] / 60:.1f}m" if s['p95'] is not None else '-'
+        size = str(s['bytes_p95']) if s['bytes_p95'] is not None else '-'
+        print(f"{kind:<7} {name:<40} {s['runs']:>4} {s['samples']:>3} {p50:>8} {p95:>8} {size:>10}")
+
+
+def update_chain_metadata(stats, chains_dir=CHAINS_DIR, min_samples=MIN_SAMPLES, dry_run=False):
+    """Replace hand-written average_duration with measured p50/p95
+
+    Chains are edited line-by-line rather than round-tripped through yaml so
+    comments and layout survive. Chains with fewer than min_samples completed
+    runs keep their estimate.
+    """
+    updated = []
+    for path in sorted(glob.glob(os.path.join(chains_dir, '**', '*.yaml'), recursive=True)):
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        match = re.search(r'^name:\s*(\S+)', content, re.MULTILINE)
+        if not match:
+            continue
+        s = stats.get(('chain', match.group(1)))
+        if not s or s['samples'] < max(1, min_samples):
+            continue
+
+        existing = DURATION_LINE_RE.search(content)
+        if existing:
+            indent = existing.group(1)
+            position = existing.start()
+        else:
+            meta = METADATA_RE.search(content)
+            if not meta:
+                continue
+            indent = '  '
+            position = meta.end()
+
+        block = (f"{indent}duration_p50: {format_minutes(s['p50'])}\n"
+                 f"{indent}duration_p95: {format_minutes(s['p95'])}\n"
+                 f"{indent}duration_samples: {s['samples']}\n")
+
+        stripped = DURATION_LINE_RE.sub('', content)
+        # Removed lines all sit at or after the insertion point
+        new_content = stripped[:position] + block + stripped[position:]
+        if new_content != content:
+            updated.append(path)
+            if not dry_run:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(new_content)
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt and chain duration telemetry")
+    parser.add_argument('--store', default=STORE_PATH, help="Path to the executions store")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    start = sub.add_parser('start', help="Record the start of a prompt or chain")
+    start.add_argument('--task', required=True)
+    start.add_argument('--prompt')
+    start.add_argument('--chain')
+
+    end = sub.add_parser('end', help="Record the end of a prompt or chain")
+    end.add_argument('--task', required=True)
+    end.add_argument('--prompt')
+    end.add_argument('--chain')
+    end.add_argument('--outcome', default='completed')
+    end.add_argument('--output', help="Output file whose size is recorded")
+    end.add_argument('--tokens', type=int, help="Token count, if known")
+
+    sub.add_parser('backfill', help="Import runs from existing logs, outputs and contexts")
+    sub.add_parser('stats', help="Show measured p50/p95 per prompt and chain")
+
+    meta = sub.add_parser('metadata', help="Write measured durations into chain metadata")
+    meta.add_argument('--dry-run', action='store_true')
+    meta.add_argument('--min-samples', type=int, default=MIN_SAMPLES,
+                      help=f"Completed runs required before a chain's estimate is replaced (default: {MIN_SAMPLES})")
+
+    args = parser.parse_args()
+
+    if args.command in ('start', 'end'):
+        if not args.prompt and not args.chain:
+            parser.error("--prompt or --chain is required")
+        kind = 'prompt' if args.prompt else 'chain'
+        name = args.prompt or args.chain
+        if args.command == 'start':
+            record_start(args.task, name, chain=args.chain, kind=kind, store=args.store)
+        else:
+            record_end(args.task, name, outcome=args.outcome, output=args.output,
+                       tokens=args.tokens, store=args.store)
+    elif args.command == 'backfill':
+        new = backfill(args.store)
+        print(f"Backfilled {len(new)} run(s) into {os.path.relpath(args.store, BASE_DIR)}")
+    elif args.command == 'stats':
+        print_stats(summarize(args.store))
+    elif args.command == 'metadata':
+        updated = update_chain_metadata(summarize(args.store), min_samples=args.min_samples, dry_run=args.dry_run)
+        for path in updated:
+            print(f"{'Would update' if args.dry_run else 'Updated'}: {os.path.relpath(path, BASE_DIR)}")
+        print(f"{len(updated)} chain(s) with at least {args.min_samples} measured runs")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
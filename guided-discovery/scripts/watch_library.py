@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Watch the prompt and chain library and re-validate only what changed.
+
+Instead of re-running fix_all_prompts_v2.py / clean_chains.sh over the whole
+tree, this keeps an index of every prompt and chain in memory and listens for
+inotify events. When a YAML file changes, only that file (and, for prompts,
+the chains that reference it) is normalized and validated again.
+
+Usage:
+    python3 watch_library.py                      # watch, report to console
+    python3 watch_library.py --status-file s.json # also write JSON status
+    python3 watch_library.py --once               # validate once and exit
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import re
+import struct
+import sys
+import time
+from datetime import datetime
+
+import yaml
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPTS_DIR = os.path.join(BASE_DIR, 'prompts')
+CHAINS_DIR = os.path.join(BASE_DIR, 'chains')
+
+# Same rules as clean_chains.sh, minus the space-collapsing pass which
+# flattens YAML indentation.
+CHAIN_RULES = [
+    (re.compile(r'^[ \t]*effectiveness: [0-9]\..*\n?', re.MULTILINE), ''),
+    (re.compile(r'^[ \t]*min_confidence_gain: [0-9]\..*\n?', re.MULTILINE), ''),
+    (re.compile(r' && confidence\.[a-z_]* [<>=]* [0-9]\.[0-9]*'), ''),
+    (re.compile(r'confidence\.[a-z_]* [<>=]* [0-9]\.[0-9]* && '), ''),
+    (re.compile(r'^[ \t]*condition: "confidence\.[a-z_]* [<>=]* [0-9]\.[0-9]*"\n?', re.MULTILINE), ''),
+]
+
+# Same header fix as fix_all_prompts_v2.py
+PROMPT_TITLE_RE = re.compile(r'^template: \| (.+?)$', re.MULTILINE)
+
+PROMPT_REF_RE = re.compile(r'^\s*-\s*prompt:\s*([A-Za-z0-9_\-]+)', re.MULTILINE)
+NAME_RE = re.compile(r'^name:\s*([A-Za-z0-9_\-]+)', re.MULTILINE)
+
+# Yielded by a watcher when events were lost and the whole tree must be rechecked
+RESCAN = None
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def normalize_chain(content):
+    """Strip hardcoded confidence values from a chain file"""
+    for pattern, replacement in CHAIN_RULES:
+        content = pattern.sub(replacement, content)
+    return content
+
+
+def normalize_prompt(content):
+    """Move an inline template title onto its own indented line"""
+    match = PROMPT_TITLE_RE.search(content)
+    if match:
+        title = match.group(1).strip()
+        content = PROMPT_TITLE_RE.sub(f'template: |\n  # {title}', content, count=1)
+    return content
+
+
+class LibraryIndex:
+    """In-memory view of the prompt and chain library"""
+
+    def __init__(self, prompts_dir=PROMPTS_DIR, chains_dir=CHAINS_DIR, fix=True):
+        self.prompts_dir = prompts_dir
+        self.chains_dir = chains_dir
+        self.fix = fix
+        self.prompts = {}      # path -> prompt name
+        self.chains = {}       # path -> list of referenced prompt names
+        self.results = {}      # path -> {'status', 'errors', 'checked_at'}
+
+    def kind(self, path):
+        if not path.endswith('.yaml'):
+            return None
+        if path.startswith(self.prompts_dir + os.sep):
+            if os.path.basename(path) == 'PROMPT_TEMPLATE.yaml':
+                return None
+            return 'prompt'
+        if path.startswith(self.chains_dir + os.sep):
+            return 'chain'
+        return None
+
+    def scan(self):
+        """Validate the whole tree once to seed the index"""
+        paths = []
+        for directory in (self.prompts_dir, self.chains_dir):
+            for root, dirs, files in os.walk(directory):
+                for file in files:
+                    path = os.path.join(root, file)
+                    if self.kind(path):
+                        paths.append(path)
+        # Prompts first so chain references can be resolved
+        for path in sorted(paths, key=lambda p: self.kind(p) != 'prompt'):
+            self.check(path)
+        return paths
+
+    def prompt_names(self):
+        return set(self.prompts.values())
+
+    def dependents(self, name):
+        """Chains whose prompt_sequence references the given prompt"""
+        return [path for path, refs in self.chains.items() if name in refs]
+
+    def update(self, path):
+        """Handle a changed or removed file; returns every path re-checked"""
+        kind = self.kind(path)
+        if not kind:
+            if not os.path.exists(path):
+                # A directory moved away or deleted: drop everything beneath it
+                return self.remove_tree(path)
+            return []
+
+        old_name = self.prompts.get(path)
+        if os.path.exists(path):
+            self.check(path)
+        else:
+            self.forget(path)
+
+        checked = [path]
+        if kind == 'prompt':
+            names = {old_name, self.prompts.get(path)} - {None}
+            for name in names:
+                for chain in self.dependents(name):
+                    if chain not in checked:
+                        self.check(chain)
+                        checked.append(chain)
+        return checked
+
+    def remove_tree(self, directory):
+        """Forget every indexed file under a directory and recheck dependents"""
+        prefix = directory.rstrip(os.sep) + os.sep
+        checked = []
+        for path in [p for p in self.results if p.startswith(prefix)]:
+            for p in self.update(path):
+                if p not in checked:
+                    checked.append(p)
+        return checked
+
+    def rescan(self):
+        """Drop everything and rebuild the index from disk"""
+        self.prompts = {}
+        self.chains = {}
+        self.results = {}
+        return self.scan()
+
+    def forget(self, path):
+        self.prompts.pop(path, None)
+        self.chains.pop(path, None)
+        self.results.pop(path, None)
+
+    def check(self, path):
+        """Normalize and validate a single file"""
+        kind = self.kind(path)
+        errors = []
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            self.forget(path)
+            return None
+        except ValueError as e:
+            # Undecodable bytes, e.g. a file saved in the wrong encoding
+            self.forget(path)
+            return self.record(path, kind, None, [f"Unreadable file: {e}"])
+
+        normalized = normalize_chain(content) if kind == 'chain' else normalize_prompt(content)
+        if self.fix and normalized != content:
+            # Rewriting fires another event, which is a no-op second pass
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(normalized)
+            content = normalized
+
+        data = None
+        try:
+            data = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            mark = getattr(e, 'problem_mark', None)
+            where = f" (line {mark.line + 1})" if mark else ''
+            errors.append(f"YAML parse error{where}: {getattr(e, 'problem', None) or e}")
+
+        if data is not None and not isinstance(data, dict):
+            errors.append("Top level must be a mapping")
+            data = None
+
+        # Fall back to regex so broken YAML still keeps the dependency graph
+        if data is not None:
+            name = data.get('name')
+        else:
+            match = NAME_RE.search(content)
+            name = match.group(1) if match else None
+
+        if not name:
+            errors.append("Missing 'name'")
+        elif not isinstance(name, str):
+            errors.append(f"'name' must be a string, got {type(name).__name__}")
+            name = None
+
+        if kind == 'prompt':
+            if name:
+                self.prompts[path] = name
+            else:
+                self.prompts.pop(path, None)
+            if data is not None and not (data.get('template') or data.get('output_format')):
+                errors.append("Missing 'template'")
+        else:
+            refs = []
+            if data is not None:
+                sequence = data.get('prompt_sequence') or []
+                if not sequence:
+                    errors.append("Missing 'prompt_sequence'")
+                elif not isinstance(sequence, list):
+                    errors.append("'prompt_sequence' must be a list")
+                    sequence = []
+                for position, step in enumerate(sequence, 1):
+                    ref = step.get('prompt') if isinstance(step, dict) else None
+                    if isinstance(ref, str) and ref:
+                        refs.append(ref)
+                    else:
+                        errors.append(f"Step {position} needs a prompt name")
+            else:
+                refs = PROMPT_REF_RE.findall(content)
+            self.chains[path] = refs
+
+            known = self.prompt_names()
+            for ref in refs:
+                if ref not in known:
+                    errors.append(f"Unknown prompt '{ref}'")
+
+        return self.record(path, kind, name, errors)
+
+    def record(self, path, kind, name, errors):
+        result = {
+            'type': kind,
+            'name': name,
+            'status': 'error' if errors else 'ok',
+            'errors': errors,
+            'checked_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.results[path] = result
+        return result
+
+    def summary(self):
+        failing = sum(1 for r in self.results.values() if r['status'] != 'ok')
+        return {
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+            'files': len(self.results),
+            'failing': failing,
+            'results': {os.path.relpath(p, BASE_DIR): r for p, r in sorted(self.results.items())},
+        }
+
+
+class InotifyWatcher:
+    """Minimal recursive inotify watcher using libc through ctypes"""
+
+    def __init__(self, directories):
+        libc_name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self.libc.inotify_init1(0)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.directories = directories
+        for directory in directories:
+            for root, dirs, files in os.walk(directory):
+                self.add(root)
+
+    def add(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = directory
+
+    def remove(self, directory, moved=False):
+        """Drop watches on a directory and everything below it"""
+        prefix = directory + os.sep
+        for wd, path in list(self.watches.items()):
+            if path == directory or path.startswith(prefix):
+                if moved:
+                    # A moved directory is still watched by the kernel
+                    self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def events(self):
+        """Block until events arrive and yield the affected paths
+
+        Yields RESCAN instead when the kernel queue overflowed, since the
+        events that were dropped can't be recovered.
+        """
+        while True:
+            buffer = os.read(self.fd, 64 * 1024)
+            changed = []
+            overflow = False
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+                offset += EVENT_HEADER.size
+                name = buffer[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+
+                directory = self.watches.get(wd)
+                if directory is None:
+                    continue
+                if mask & IN_DELETE_SELF:
+                    del self.watches[wd]
+                    continue
+
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_MOVED_FROM | IN_DELETE):
+                        self.remove(path, moved=bool(mask & IN_MOVED_FROM))
+                        if path not in changed:
+                            changed.append(path)
+                    elif mask & (IN_CREATE | IN_MOVED_TO):
+                        for root, dirs, files in os.walk(path):
+                            self.add(root)
+                            changed.extend(os.path.join(root, f) for f in files)
+                    continue
+                if mask & IN_CREATE and not mask & IN_CLOSE_WRITE:
+                    # Wait for the matching IN_CLOSE_WRITE
+                    continue
+                if path not in changed:
+                    changed.append(path)
+
+            if overflow:
+                # Directories created during the burst may have no watch yet
+                for directory in self.directories:
+                    for root, dirs, files in os.walk(directory):
+                        self.add(root)
+                yield RESCAN
+            else:
+                yield changed
+
+
+class PollingWatcher:
+    """Fallback for platforms without inotify"""
+
+    def __init__(self, directories, interval=0.5):
+        self.directories = directories
+        self.interval = interval
+        self.mtimes = self.snapshot()
+
+    def snapshot(self):
+        mtimes = {}
+        for directory in self.directories:
+            for root, dirs, files in os.walk(directory):
+                for file in files:
+                    path = os.path.join(root, file)
+                    try:
+                        mtimes[path] = os.stat(path).st_mtime_ns
+                    except OSError:
+                        pass
+        return mtimes
+
+    def events(self):
+        while True:
+            time.sleep(self.interval)
+            current = self.snapshot()
+            changed = [p for p in current if current[p] != self.mtimes.get(p)]
+            changed += [p for p in self.mtimes if p not in current]
+            self.mtimes = current
+            if changed:
+                yield changed
+
+
+def report(index, paths, status_file=None, elapsed=None):
+    """Print results for the checked paths and refresh the status file"""
+    for path in paths:
+        rel = os.path.relpath(path, BASE_DIR)
+        result = index.results.get(path)
+        if result is None:
+            print(f"Removed: {rel}")
+        elif result['errors']:
+            print(f"❌ {rel}")
+            for error in result['errors']:
+                print(f"    - {error}")
+        else:
+            print(f"✅ {rel}")
+
+    if elapsed is not None:
+        print(f"Checked {len(paths)} file(s) in {elapsed * 1000:.1f} ms")
+    sys.stdout.flush()
+
+    if status_file:
+        tmp = status_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index.summary(), f, indent=2)
+        os.replace(tmp, status_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally validate prompts and chains")
+    parser.add_argument('--status-file', help="Write JSON validation status to this file")
+    parser.add_argument('--once', action='store_true', help="Validate the whole tree and exit")
+    parser.add_argument('--no-fix', action='store_true', help="Validate only, never rewrite files")
+    parser.add_argument('--poll', action='store_true', help="Use mtime polling instead of inotify")
+    args = parser.parse_args()
+
+    index = LibraryIndex(fix=not args.no_fix)
+    started = time.perf_counter()
+    paths = index.scan()
+    report(index, paths, args.status_file, time.perf_counter() - started)
+
+    if args.once:
+        return 1 if index.summary()['failing'] else 0
+
+    directories = [PROMPTS_DIR, CHAINS_DIR]
+    watcher = None
+    if not args.poll and sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    if watcher is None:
+        watcher = PollingWatcher(directories)
+
+    print(f"Watching {os.path.relpath(PROMPTS_DIR, BASE_DIR)}/ and {os.path.relpath(CHAINS_DIR, BASE_DIR)}/ (Ctrl+C to stop)")
+    try:
+        for changed in watcher.events():
+            started = time.perf_counter()
+            if changed is RESCAN:
+                print("inotify queue overflowed, rescanning the whole library")
+                report(index, index.rescan(), args.status_file, time.perf_counter() - started)
+                continue
+            checked = []
+            for path in changed:
+                for p in index.update(path):
+                    if p not in checked:
+                        checked.append(p)
+            if checked:
+                report(index, checked, args.status_file, time.perf_counter() - started)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
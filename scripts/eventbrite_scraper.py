@@ -10,24 +10,41 @@ Requirements:
 - Python 3
 - requests
 - beautifulsoup4
+- zstandard (optional, for --archive; zlib is used without it)
 
 Usage:
     python3 eventbrite_scraper.py
+    python3 eventbrite_scraper.py --delta
+    python3 eventbrite_scraper.py --archive eventbrite_archive
+    python3 eventbrite_scraper.py --archive eventbrite_archive --reparse
+    python3 eventbrite_scraper.py --archive eventbrite_archive --rebuild-index
 
 Output:
     yakima_eventbrite_events.csv
+    yakima_eventbrite_changes.jsonl   (--delta: header record, then added/updated/removed since last run)
+    yakima_eventbrite_snapshot.json   (--delta: per-event hashes for the next run)
+
+    --reparse writes the same files with a .reparse suffix (e.g.
+    yakima_eventbrite_events.reparse.csv) so replaying the archive never
+    touches the live snapshot the importer relies on.
 """
 
+import argparse
 import requests
 import json
 import csv
+import hashlib
+import os
 import time
 import logging
 import re
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urljoin, urlparse
 from datetime import datetime
 from bs4 import BeautifulSoup
 
+from page_archive import PageArchive
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -39,8 +56,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+LIVE_OUTPUTS = {
+    'csv_file': 'yakima_eventbrite_events.csv',
+    'changes_file': 'yakima_eventbrite_changes.jsonl',
+    'snapshot_file': 'yakima_eventbrite_snapshot.json',
+}
+REPARSE_OUTPUTS = {
+    'csv_file': 'yakima_eventbrite_events.reparse.csv',
+    'changes_file': 'yakima_eventbrite_changes.reparse.jsonl',
+    'snapshot_file': 'yakima_eventbrite_snapshot.reparse.json',
+}
+
+CSV_FIELDNAMES = ['title', 'start_date', 'end_date', 'venue_name', 'venue_location', 'organizer', 'url', 'image_url']
+
 class EventbriteScraper:
-    def __init__(self):
+    def __init__(self, archive_dir=None):
         self.base_url = "https://www.eventbrite.com"
         self.search_url = "https://www.eventbrite.com/d/online/yakima/"
         self.session = requests.Session()
@@ -51,6 +81,10 @@ class EventbriteScraper:
         })
         
         self.events = []
+        self.failed_urls = []
+        
+        # Raw pages are kept so extraction fixes can be replayed with --reparse
+        self.archive = PageArchive(archive_dir) if archive_dir else None
         
     def scrape_search_results(self):
         """Scrape the main search results page for event links"""
@@ -339,8 +373,22 @@ class EventbriteScraper:
         try:
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+        except requests.RequestException as e:
+            logger.error(f"Error fetching event page {url}: {e}")
+            return None
+        
+        if self.archive:
+            try:
+                self.archive.put(url, response.content)
+            except OSError as e:
+                logger.warning(f"Could not archive {url}: {e}")
+        
+        return self.parse_event_page(response.content, url)
+    
+    def parse_event_page(self, content, url):
+        """Extract event details from a fetched (or archived) event page"""
+        try:
+            soup = BeautifulSoup(content, 'html.parser')
             
             # Try JSON-LD first
             event = self.extract_json_ld(soup)
@@ -361,9 +409,6 @@ class EventbriteScraper:
             
             return event
             
-        except requests.RequestException as e:
-            logger.error(f"Error fetching event page {url}: {e}")
-            return None
         except Exception as e:
             logger.error(f"Error parsing event page {url}: {e}")
             return None
@@ -374,10 +419,8 @@ class EventbriteScraper:
             logger.warning("No events to save")
             return
         
-        fieldnames = ['title', 'start_date', 'end_date', 'venue_name', 'venue_location', 'organizer', 'url', 'image_url']
-        
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES, extrasaction='ignore')
             writer.writeheader()
             
             for event in self.events:
@@ -385,7 +428,138 @@ class EventbriteScraper:
         
         logger.info(f"Saved {len(self.events)} events to {filename}")
     
-    def run(self):
+    def normalize_event(self, event):
+        """Reduce an event to the exported fields with whitespace trimmed"""
+        return {field: str(event.get(field) or '').strip() for field in CSV_FIELDNAMES}
+    
+    def hash_event(self, record):
+        """Stable content hash of a normalized event"""
+        payload = json.dumps(record, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def load_snapshot(self, filename):
+        """Load the previous run's snapshot as (events keyed by URL, generated_at)"""
+        if not os.path.exists(filename):
+            return {}, None
+        
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            return snapshot.get('events', {}), snapshot.get('generated_at')
+        except (OSError, json.JSONDecodeError, AttributeError) as e:
+            logger.warning(f"Could not read snapshot {filename}, treating all events as new: {e}")
+            return {}, None
+    
+    def write_changeset(self, changes_file, changes, status, generated_at, previous_generated_at):
+        """Write the changeset, led by a header record the importer can check
+        
+        The header carries the snapshot's generated_at, so a consumer can tell
+        a fresh changeset from one it already applied, and a failed run from a
+        run with no changes.
+        """
+        header = {
+            'op': 'header',
+            'status': status,
+            'generated_at': generated_at,
+            'previous_generated_at': previous_generated_at,
+            'counts': {op: sum(1 for c in changes if c['op'] == op) for op in ('added', 'updated', 'removed')},
+        }
+        
+        tmp_file = changes_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for record in [header] + changes:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        os.replace(tmp_file, changes_file)
+        return header['counts']
+    
+    def save_delta(self, changes_file='yakima_eventbrite_changes.jsonl', snapshot_file='yakima_eventbrite_snapshot.json'):
+        """Write only events added, updated or removed since the last snapshot"""
+        previous, previous_generated_at = self.load_snapshot(snapshot_file)
+        generated_at = datetime.now().isoformat(timespec='seconds')
+        
+        if not self.events:
+            # An empty scrape is almost always a failure, not a mass removal.
+            # Replace the old changeset so it can't be applied a second time.
+            logger.warning("No events scraped, leaving snapshot untouched")
+            self.write_changeset(changes_file, [], 'failed', generated_at, previous_generated_at)
+            return
+        
+        current = {}
+        changes = []
+        
+        for event in self.events:
+            record = self.normalize_event(event)
+            url = record['url']
+            digest = self.hash_event(record)
+            current[url] = {'hash': digest, 'event': record}
+            
+            old = previous.get(url)
+            if old is None:
+                changes.append({'op': 'added', 'url': url, 'hash': digest, 'event': record})
+            elif old.get('hash') != digest:
+                changes.append({'op': 'updated', 'url': url, 'hash': digest, 'event': record})
+        
+        failed = set(self.failed_urls)
+        for url, old in previous.items():
+            if url in current:
+                continue
+            if url in failed:
+                # Still listed but the page failed this run - keep the last known version
+                current[url] = old
+                continue
+            changes.append({'op': 'removed', 'url': url, 'hash': old.get('hash')})
+        
+        counts = self.write_changeset(changes_file, changes, 'ok', generated_at, previous_generated_at)
+        
+        # Write the snapshot atomically so an interrupted run can't corrupt the baseline
+        tmp_file = snapshot_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'generated_at': generated_at, 'events': current}, f, ensure_ascii=False)
+        os.replace(tmp_file, snapshot_file)
+        
+        logger.info(f"Delta: {counts['added']} added, {counts['updated']} updated, {counts['removed']} removed -> {changes_file}")
+    
+    def save_results(self, delta=False, outputs=LIVE_OUTPUTS):
+        """Write the changeset and the CSV independently of each other"""
+        # Changeset first: the snapshot must stay in step with what the
+        # importer has seen even if the full CSV export fails
+        if delta:
+            try:
+                self.save_delta(outputs['changes_file'], outputs['snapshot_file'])
+            except (OSError, ValueError) as e:
+                logger.error(f"Error writing delta: {e}")
+        
+        try:
+            self.save_to_csv(outputs['csv_file'])
+        except (OSError, ValueError) as e:
+            logger.error(f"Error writing CSV: {e}")
+    
+    def reparse(self, workers=None, delta=False):
+        """Re-extract events from archived pages using the current parsing code"""
+        if not self.archive:
+            logger.error("Reparse needs an archive directory")
+            return
+        
+        pages = self.archive.latest()
+        logger.info(f"Reparsing {len(pages)} archived pages from {self.archive.path}")
+        
+        # BeautifulSoup parsing is CPU-bound, so spread it across processes
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_reparse_worker,
+                                 initargs=(self.archive.path,)) as executor:
+            results = executor.map(_reparse_page, pages.items(), chunksize=16)
+            for url, event in zip(pages, results):
+                if event and event.get('title'):
+                    self.events.append(event)
+                else:
+                    self.failed_urls.append(url)
+                    logger.warning(f"❌ Failed to reparse event: {url}")
+        
+        # Archived pages include delisted events, so keep away from live outputs
+        self.save_results(delta=delta, outputs=REPARSE_OUTPUTS)
+        
+        logger.info(f"Reparse complete. Extracted {len(self.events)} events out of {len(pages)} pages.")
+    
+    def run(self, delta=False):
         """Main scraping process"""
         logger.info("Starting Eventbrite scraper for Yakima events")
         
@@ -394,6 +568,8 @@ class EventbriteScraper:
         
         if not event_links:
             logger.error("No events found on search page")
+            # Still mark the changeset as failed so yesterday's isn't re-applied
+            self.save_results(delta=delta)
             return
         
         # Scrape each event page
@@ -405,6 +581,7 @@ class EventbriteScraper:
                 self.events.append(event)
                 logger.info(f"✅ Scraped: {event['title']}")
             else:
+                self.failed_urls.append(url)
                 logger.warning(f"❌ Failed to scrape event: {url}")
             
             # Be polite - pause between requests
@@ -412,13 +589,52 @@ class EventbriteScraper:
                 time.sleep(2)
         
         # Save results
-        self.save_to_csv()
+        self.save_results(delta=delta)
         
         logger.info(f"Scraping complete. Found {len(self.events)} events out of {len(event_links)} pages.")
 
+_worker_scraper = None
+
+def _init_reparse_worker(archive_dir):
+    global _worker_scraper
+    _worker_scraper = EventbriteScraper(archive_dir)
+
+def _reparse_page(item):
+    url, digest = item
+    try:
+        content = _worker_scraper.archive.get(digest)
+    except Exception as e:
+        logger.error(f"Could not read archived page {url}: {e}")
+        return None
+    return _worker_scraper.parse_event_page(content, url)
+
 def main():
-    scraper = EventbriteScraper()
-    scraper.run()
+    parser = argparse.ArgumentParser(description="Scrape Yakima events from Eventbrite")
+    parser.add_argument('--delta', action='store_true',
+                        help="Also write a changeset of added/updated/removed events since the last run")
+    parser.add_argument('--archive', metavar='DIR',
+                        help="Store fetched event pages in a content-addressed archive")
+    parser.add_argument('--reparse', action='store_true',
+                        help="Re-extract events from the archive instead of fetching (writes *.reparse.* outputs)")
+    parser.add_argument('--workers', type=int,
+                        help="Worker processes for --reparse (default: CPU count)")
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help="Recreate the archive index from its segment files and exit")
+    args = parser.parse_args()
+    
+    if (args.reparse or args.rebuild_index) and not args.archive:
+        parser.error("--reparse and --rebuild-index require --archive")
+    
+    scraper = EventbriteScraper(archive_dir=args.archive)
+    if args.rebuild_index:
+        recovered, missing = scraper.archive.rebuild_index()
+        logger.info(f"Rebuilt index with {recovered} pages")
+        if missing:
+            logger.warning(f"{missing} manifest entries point at pages not found in any segment")
+    elif args.reparse:
+        scraper.reparse(workers=args.workers, delta=args.delta)
+    else:
+        scraper.run(delta=args.delta)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
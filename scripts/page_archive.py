@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Content-addressed archive of fetched pages
+==========================================
+
+Stores raw page bodies so extraction fixes can be replayed without crawling
+again. Layout of an archive directory:
+
+    segments/seg-000001.bin   concatenated compressed pages, rotated by size
+    index.bin                 open-addressed hash table of page locations
+    manifest.jsonl            one line per fetch: url, sha256, fetched_at
+
+Pages are keyed by the sha256 of their raw bytes, so identical pages are only
+stored once. Each page is compressed as its own frame with zstd when the
+`zstandard` package is installed, otherwise zlib; the codec is recorded per
+page so archives written either way can be read back.
+
+index.bin stays memory-mapped for the life of the archive and is probed in
+place: a small header followed by fixed-width slots, with the slot chosen from
+the digest and collisions resolved by linear probing. It doubles in size once
+half the slots are used. If index.bin is lost or left empty while segments
+exist, it is rebuilt by walking the compressed frames in every segment.
+"""
+
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FRAME_ERRORS = (zlib.error, RuntimeError, ValueError) + ((zstandard.ZstdError,) if zstandard else ())
+
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+# magic, format version, slot count, used slots
+INDEX_HEADER = struct.Struct('<4sIQQ')
+INDEX_MAGIC = b'PGIX'
+INDEX_VERSION = 1
+# sha256 digest, codec, segment number, offset, compressed length, raw length
+INDEX_RECORD = struct.Struct('<32sBIQII')
+EMPTY_DIGEST = bytes(32)
+INITIAL_SLOTS = 1024
+
+SEGMENT_LIMIT = 64 * 1024 * 1024
+SEGMENT_RE = re.compile(r'seg-(\d+)\.bin$')
+ZSTD_FRAME_MAGIC = b'\x28\xb5\x2f\xfd'
+REBUILD_CHUNK = 64 * 1024
+
+
+class PageArchive:
+    def __init__(self, path, segment_limit=SEGMENT_LIMIT):
+        self.path = path
+        self.segment_limit = segment_limit
+        self.segments_dir = os.path.join(path, 'segments')
+        self.index_path = os.path.join(path, 'index.bin')
+        self.manifest_path = os.path.join(path, 'manifest.jsonl')
+        os.makedirs(self.segments_dir, exist_ok=True)
+
+        self._maps = {}
+        segments = self.segment_numbers()
+        self.segment = max(segments, default=1)
+
+        if not os.path.exists(self.index_path):
+            self.create_index(self.index_path, INITIAL_SLOTS)
+        self.open_index()
+        if self.used == 0 and any(os.path.getsize(self.segment_path(n)) for n in segments):
+            # Segments hold pages the index doesn't know about
+            self.rebuild_index()
+
+        if zstandard:
+            self._compress = zstandard.ZstdCompressor(level=10).compress
+            self.codec = CODEC_ZSTD
+        else:
+            self._compress = lambda data: zlib.compress(data, 9)
+            self.codec = CODEC_ZLIB
+
+    # -----------------------------------------------------------------------
+    # Index
+    # -----------------------------------------------------------------------
+
+    @staticmethod
+    def create_index(path, slots):
+        with open(path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, slots, 0))
+            f.truncate(INDEX_HEADER.size + slots * INDEX_RECORD.size)
+
+    def open_index(self):
+        self._index_file = open(self.index_path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        magic, version, self.slots, self.used = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close_index()
+            raise ValueError(f"{self.index_path} is not a page archive index")
+
+    def close_index(self):
+        self._index.close()
+        self._index_file.close()
+
+    @staticmethod
+    def _probe_table(view, slots, raw_digest):
+        """Byte offset of the slot holding raw_digest, or of the empty slot where it belongs"""
+        slot = int.from_bytes(raw_digest[:8], 'little') % slots
+        while True:
+            position = INDEX_HEADER.size + slot * INDEX_RECORD.size
+            stored = view[position:position + 32]
+            if stored == raw_digest or stored == EMPTY_DIGEST:
+                return position
+            slot = (slot + 1) % slots
+
+    def _probe(self, raw_digest):
+        return self._probe_table(self._index, self.slots, raw_digest)
+
+    def lookup(self, digest):
+        """Location tuple (codec, segment, offset, length, raw_length) or None"""
+        raw = bytes.fromhex(digest)
+        position = self._probe(raw)
+        record = INDEX_RECORD.unpack_from(self._index, position)
+        return record[1:] if record[0] == raw else None
+
+    def __contains__(self, digest):
+        return self.lookup(digest) is not None
+
+    def __len__(self):
+        return self.used
+
+    def _insert(self, raw_digest, entry):
+        position = self._probe(raw_digest)
+        if self._index[position:position + 32] == raw_digest:
+            return
+        INDEX_RECORD.pack_into(self._index, position, raw_digest, *entry)
+        self.used += 1
+        INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC, INDEX_VERSION, self.slots, self.used)
+
+    def records(self):
+        """Every occupied slot as (digest, codec, segment, offset, length, raw_length)"""
+        for slot in range(self.slots):
+            record = INDEX_RECORD.unpack_from(self._index, INDEX_HEADER.size + slot * INDEX_RECORD.size)
+            if record[0] != EMPTY_DIGEST:
+                yield record
+
+    def _replace_index(self, records, slots):
+        """Write a complete table to a temp file, then swap it in
+
+        The new table is fully populated and flushed before os.replace, so a
+        crash at any point leaves either the old index or the new one.
+        """
+        while len(records) * 2 > slots:
+            slots *= 2
+
+        tmp_path = self.index_path + '.tmp'
+        self.create_index(tmp_path, slots)
+        with open(tmp_path, 'r+b') as f:
+            with mmap.mmap(f.fileno(), 0) as view:
+                for record in records:
+                    position = self._probe_table(view, slots, record[0])
+                    INDEX_RECORD.pack_into(view, position, *record)
+                INDEX_HEADER.pack_into(view, 0, INDEX_MAGIC, INDEX_VERSION, slots, len(records))
+                view.flush()
+            os.fsync(f.fileno())
+
+        self.close_index()
+        os.replace(tmp_path, self.index_path)
+        self.open_index()
+
+    def _grow(self):
+        """Rehash into a table twice the size"""
+        self._replace_index(list(self.records()), self.slots * 2)
+
+    def rebuild_index(self):
+        """Recreate index.bin from the segment files
+
+        Each page is a self-delimiting zstd or zlib frame, so segments can be
+        walked without the index. Returns (pages recovered, manifest digests
+        still missing); missing pages are skipped by latest().
+        """
+        records = {}
+        for segment in self.segment_numbers():
+            with open(self.segment_path(segment), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    offset = 0
+                    while offset < len(view):
+                        try:
+                            codec, content, length = self._read_frame(view, offset)
+                        except FRAME_ERRORS:
+                            # A torn write at the end of a segment; nothing after it is indexed
+                            break
+                        digest = hashlib.sha256(content).digest()
+                        records.setdefault(digest, (digest, codec, segment, offset, length, len(content)))
+                        offset += length
+
+        self._replace_index(list(records.values()), INITIAL_SLOTS)
+
+        missing = set()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        digest = json.loads(line).get('sha256')
+                    except json.JSONDecodeError:
+                        continue
+                    if digest and digest not in self:
+                        missing.add(digest)
+        return len(records), len(missing)
+
+    @staticmethod
+    def _read_frame(view, offset):
+        """Decompress the frame starting at offset; returns (codec, content, frame length)"""
+        if view[offset:offset + 4] == ZSTD_FRAME_MAGIC:
+            if zstandard is None:
+                raise RuntimeError("Archive contains zstd pages but the zstandard package is not installed")
+            codec = CODEC_ZSTD
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            codec = CODEC_ZLIB
+            decompressor = zlib.decompressobj()
+
+        parts = []
+        position = offset
+        while not decompressor.eof:
+            if position >= len(view):
+                raise ValueError("truncated frame")
+            chunk = view[position:position + REBUILD_CHUNK]
+            position += len(chunk)
+            parts.append(decompressor.decompress(chunk))
+        length = position - offset - len(decompressor.unused_data)
+        return codec, b''.join(parts), length
+
+    # -----------------------------------------------------------------------
+    # Pages
+    # -----------------------------------------------------------------------
+
+    def segment_path(self, segment):
+        return os.path.join(self.segments_dir, f"seg-{segment:06d}.bin")
+
+    def segment_numbers(self):
+        paths = glob.glob(os.path.join(self.segments_dir, 'seg-*.bin'))
+        return sorted(int(m.group(1)) for m in map(SEGMENT_RE.search, paths) if m)
+
+    def put(self, url, content):
+        """Archive a fetched page body and return its sha256"""
+        digest = hashlib.sha256(content).hexdigest()
+
+        if digest not in self:
+            compressed = self._compress(content)
+            path = self.segment_path(self.segment)
+            if os.path.exists(path) and os.path.getsize(path) + len(compressed) > self.segment_limit:
+                self.segment += 1
+                path = self.segment_path(self.segment)
+
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(compressed)
+
+            # Segment data is written before the index slot that points at it
+            if (self.used + 1) * 2 > self.slots:
+                self._grow()
+            self._insert(bytes.fromhex(digest), (self.codec, self.segment, offset, len(compressed), len(content)))
+            self._index.flush()
+
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'url': url,
+                'sha256': digest,
+                'fetched_at': datetime.now().isoformat(timespec='seconds'),
+            }, separators=(',', ':')) + '\n')
+
+        return digest
+
+    def get(self, digest):
+        """Return the raw page body for a digest"""
+        entry = self.lookup(digest)
+        if entry is None:
+            raise KeyError(digest)
+        codec, segment, offset, length, raw_length = entry
+
+        view = self._maps.get(segment)
+        if view is None:
+            with open(self.segment_path(segment), 'rb') as f:
+                view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = view
+
+        data = view[offset:offset + length]
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Archive contains zstd pages but the zstandard package is not installed")
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_length)
+        return zlib.decompress(data)
+
+    def latest(self):
+        """Most recent archived digest for each URL, in first-seen order"""
+        pages = {}
+        if not os.path.exists(self.manifest_path):
+            return pages
+
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('sha256') in self:
+                    pages[record['url']] = record['sha256']
+        return pages
+
+    def close(self):
+        for view in self._maps.values():
+            view.close()
+        self._maps = {}
+        self.close_index()